@@ -1,19 +1,20 @@
 from __future__ import annotations
 
-import contextlib
-import os
 import logging
+import secrets
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from types import SimpleNamespace
+from typing import Optional, Dict, Any, List, Tuple
 
 from fastapi import FastAPI, Request, Form
-from fastapi.responses import RedirectResponse
+from fastapi.responses import ORJSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from starlette.middleware.sessions import SessionMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.templating import Jinja2Templates
 
-from modules.imap_client import IMAPClient
+from modules.imap_pool import IMAPConnectionPool
 
 
 # ВАЖНО: берём корень проекта (…/WebMail), а не …/WebMail/app
@@ -21,6 +22,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 TEMPLATES_DIR = BASE_DIR / "app" / "templates"
 STATIC_DIR = BASE_DIR / "app" / "static"
 
+DEFAULT_INBOX_LIMIT = 20
+SESSION_COOKIE = "sid"
+
 
 class SecurityHeadersMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
@@ -31,16 +35,66 @@ class SecurityHeadersMiddleware(BaseHTTPMiddleware):
         return response
 
 
+class SessionStore:
+    """
+    Серверное хранилище сессий: token → (email, password).
+    В cookie лежит только непрозрачный токен; LRU с TTL, продлевается при обращении.
+    """
+
+    def __init__(self, *, ttl: float = 30 * 60, max_size: int = 10_000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+
+    def create(self, email: str, password: str) -> str:
+        token = secrets.token_urlsafe(32)
+        now = time.monotonic()
+        # TTL одинаковый, порядок — по последнему обращению: протухшие всегда в начале.
+        # Чистим их здесь, иначе пароли брошенных сессий висели бы в памяти до max_size
+        while self._data:
+            oldest = next(iter(self._data))
+            if self._data[oldest][2] >= now:
+                break
+            del self._data[oldest]
+        self._data[token] = (email, password, now + self.ttl)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+        return token
+
+    def get(self, token: Optional[str]) -> Optional[Tuple[str, str]]:
+        if not token:
+            return None
+        entry = self._data.get(token)
+        if entry is None:
+            return None
+        email, password, expires = entry
+        now = time.monotonic()
+        if expires < now:
+            del self._data[token]
+            return None
+        self._data[token] = (email, password, now + self.ttl)
+        self._data.move_to_end(token)
+        return email, password
+
+    def delete(self, token: Optional[str]) -> None:
+        if token:
+            self._data.pop(token, None)
+
+
 class WebMailApp:
-    def __init__(self, *, secret_key: str, logger: Optional[logging.Logger] = None):
+    def __init__(self, *, logger: Optional[logging.Logger] = None):
         self._validate_paths()
-        self.app = FastAPI(title="WebMail", version="1.0.0")
-        self.app.add_middleware(SessionMiddleware, secret_key=secret_key)
+        self.app = FastAPI(title="WebMail", version="1.0.0", default_response_class=ORJSONResponse)
         self.app.add_middleware(SecurityHeadersMiddleware)
 
         self.app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
         self.templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
+        # Страница входа для анонима статична — рендерим один раз при старте
+        self._login_html_cache: Optional[bytes] = None
         self.logger = logger or logging.getLogger("app.web")
+        # Живые IMAP-соединения переиспользуются между запросами
+        self._pool = IMAPConnectionPool()
+        self._sessions = SessionStore()
 
         self._register_routes()
 
@@ -51,31 +105,73 @@ class WebMailApp:
             raise RuntimeError(f"Static directory not found: {STATIC_DIR}")
 
     def _get_credentials(self, request: Request) -> Optional[Dict[str, str]]:
-        email = request.session.get("email")
-        password = request.session.get("password")
-        return {"email": email, "password": password} if email and password else None
-
-    async def _fetch_messages(self, email: str, password: str, limit: int = 20) -> List[Dict[str, Any]]:
-        client = IMAPClient(email, password)
-        try:
-            await client.connect()
-            return await client.get_messages(limit=limit, criteria="ALL", mark_seen=False)
-        finally:
-            await client.disconnect()
+        # Кэш на время запроса: сессию ищем один раз, False — аноним
+        cached = getattr(request.state, "_creds_cached", None)
+        if cached is not None:
+            return cached or None
+
+        found = self._sessions.get(request.cookies.get(SESSION_COOKIE))
+        creds = {"email": found[0], "password": found[1]} if found else None
+        request.state._creds_cached = creds or False
+        request.state.user_email = creds["email"] if creds else None
+        return creds
+
+    def _start_session(self, request: Request, response: Response, email: str, password: str) -> None:
+        token = self._sessions.create(email, password)
+        # cookie на сессию браузера: срок жизни определяет скользящий TTL на сервере
+        response.set_cookie(
+            SESSION_COOKIE,
+            token,
+            httponly=True,
+            secure=request.url.scheme == "https",
+            samesite="lax",
+        )
+        request.state._creds_cached = {"email": email, "password": password}
+
+    def _end_session(self, request: Request, response: Response) -> None:
+        """Удаляет сессию из хранилища и cookie, сбрасывает кэш текущего запроса."""
+        self._sessions.delete(request.cookies.get(SESSION_COOKIE))
+        response.delete_cookie(SESSION_COOKIE)
+        request.state._creds_cached = False
+        request.state.user_email = None
+
+    async def _fetch_messages(self, email: str, password: str, limit: int = DEFAULT_INBOX_LIMIT) -> List[Dict[str, Any]]:
+        async with self._pool.acquire(email, password) as client:
+            return await client.get_messages(limit=limit, criteria="ALL", mark_seen=False, summary_only=True)
+
+    async def _fetch_message(self, email: str, password: str, uid: int) -> Optional[Dict[str, Any]]:
+        async with self._pool.acquire(email, password) as client:
+            return await client.get_message(uid, mark_seen=False)
+
+    def _render_login_page(self) -> bytes:
+        # шаблону нужен только request.state.user_email — подставляем анонимную заглушку
+        anonymous = SimpleNamespace(state=SimpleNamespace(user_email=None))
+        return self.templates.get_template("login.html").render({"request": anonymous}).encode("utf-8")
 
     def _register_routes(self) -> None:
+        @self.app.on_event("startup")
+        async def _warm_templates():
+            self._login_html_cache = self._render_login_page()
+
+        @self.app.on_event("shutdown")
+        async def _close_pool():
+            await self._pool.close()
+
         @self.app.get("/", tags=["ui"])
         async def index(request: Request):
             if self._get_credentials(request):
                 return RedirectResponse(url="/inbox", status_code=303)
-            return self.templates.TemplateResponse("login.html", {"request": request})
+            if self._login_html_cache is None:
+                self._login_html_cache = self._render_login_page()
+            return Response(content=self._login_html_cache, media_type="text/html; charset=utf-8")
 
         @self.app.post("/login", tags=["auth"])
         async def login(request: Request, email: str = Form(...), password: str = Form(...)):
             email = email.strip()
-            client = IMAPClient(email, password)
             try:
-                await client.connect()
+                # Соединение остаётся в пуле — первый /inbox не платит за повторный LOGIN
+                async with self._pool.acquire(email, password):
+                    pass
             except Exception:
                 # Показываем единое безопасное сообщение об ошибке входа
                 return self.templates.TemplateResponse(
@@ -84,21 +180,22 @@ class WebMailApp:
                     status_code=401,
                 )
             else:
-                # Сохраняем email и пароль в сессии, чтобы /inbox смог получить письма
-                request.session["email"] = email
-                request.session["password"] = password
-                return RedirectResponse(url="/inbox", status_code=303)
-            finally:
-                with contextlib.suppress(Exception):
-                    await client.disconnect()
+                # Сохраняем email и пароль в серверной сессии, чтобы /inbox смог получить письма
+                response = RedirectResponse(url="/inbox", status_code=303)
+                self._start_session(request, response, email, password)
+                return response
 
         @self.app.post("/logout", tags=["auth"])
         async def logout(request: Request):
-            request.session.clear()
-            return RedirectResponse(url="/", status_code=303)
+            creds = self._get_credentials(request)
+            if creds:
+                await self._pool.evict(creds["email"])
+            response = RedirectResponse(url="/", status_code=303)
+            self._end_session(request, response)
+            return response
 
         @self.app.get("/inbox", tags=["ui"])
-        async def inbox(request: Request, limit: int = 20):
+        async def inbox(request: Request, limit: int = DEFAULT_INBOX_LIMIT):
             creds = self._get_credentials(request)
             if not creds:
                 return RedirectResponse(url="/", status_code=303)
@@ -106,12 +203,35 @@ class WebMailApp:
                 messages = await self._fetch_messages(creds["email"], creds["password"], limit=limit)
             except Exception as e:
                 self.logger.warning("Ошибка получения писем: %s", e)
-                request.session.clear()
+                response = RedirectResponse(url="/", status_code=303)
+                self._end_session(request, response)
+                return response
+
+            # Отдаём HTML по кускам: браузер начинает рисовать до конца рендера всего ящика
+            stream = self.templates.get_template("inbox.html").stream(
+                {"request": request, "email": creds["email"], "messages": messages, "limit": limit}
+            )
+            stream.enable_buffering(5)
+            return StreamingResponse(stream, media_type="text/html")
+
+        @self.app.get("/message/{uid}", tags=["ui"])
+        async def message(request: Request, uid: int):
+            creds = self._get_credentials(request)
+            if not creds:
                 return RedirectResponse(url="/", status_code=303)
+            try:
+                mail = await self._fetch_message(creds["email"], creds["password"], uid)
+            except Exception as e:
+                self.logger.warning("Ошибка получения письма %s: %s", uid, e)
+                response = RedirectResponse(url="/", status_code=303)
+                self._end_session(request, response)
+                return response
 
+            if mail is None:
+                return RedirectResponse(url="/inbox", status_code=303)
             return self.templates.TemplateResponse(
-                "inbox.html",
-                {"request": request, "email": creds["email"], "messages": messages, "limit": limit},
+                "message.html",
+                {"request": request, "email": creds["email"], "mail": mail},
             )
 
     def get_app(self) -> FastAPI:
@@ -119,9 +239,8 @@ class WebMailApp:
 
 
 def create_app() -> FastAPI:
-    secret = os.getenv("APP_SECRET_KEY", "dev-secret-change-me")
     logger = logging.getLogger("app.web")
-    web = WebMailApp(secret_key=secret, logger=logger)
+    web = WebMailApp(logger=logger)
     return web.get_app()
 
 
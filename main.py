@@ -1,32 +1,48 @@
 # main.py
 import os
+import sys
 import logging
-import asyncio
 import uvicorn
 
 from modules.logger import init_logging, get_logger
 from app.web import create_app
 
-# Логгер твоего проекта
+# PROD=1 — боевой режим: без access-логов uvicorn
+PROD = bool(os.getenv("PROD"))
+
+# Логгер твоего проекта (цветной Rich-вывод включается через LOG_PRETTY=1)
 init_logging(level=logging.INFO, log_file="app.log")
 logger = get_logger(__name__)
 logger.info("Приложение запущено")
 
-# Можно задать секрет через переменные окружения
-os.environ.setdefault("APP_SECRET_KEY", "dev-secret-change-me")
+# Минимальная рекомендуемая версия CPython: в 3.13 email.feedparser перестал компилировать
+# regex границы multipart на каждое письмо (вынесен boundaryendRE + быстрый отсев по
+# line.startswith). Это ускоряет stdlib-фолбэк, если fast_mail_parser не справился
+MIN_PYTHON = (3, 13)
+if sys.version_info < MIN_PYTHON:
+    logger.warning(
+        "Python %s.%s: stdlib-разбор multipart-писем медленнее, чем в %s.%s+ (рекомендуется обновиться)",
+        *sys.version_info[:2], *MIN_PYTHON,
+    )
+
+# uvloop (C-реализация event loop) под Windows недоступен
+LOOP = "asyncio" if sys.platform == "win32" else "uvloop"
 
-async def main():
+def main():
     app = create_app()
     config = uvicorn.Config(
         app=app,
         host="127.0.0.1",
         port=8000,
-        log_level="info",
-        loop="asyncio",
+        log_level="warning" if PROD else "info",
+        access_log=not PROD,
+        loop=LOOP,
+        http="httptools",
         reload=False,
     )
     server = uvicorn.Server(config)
-    await server.serve()
+    # run(), а не asyncio.run(serve()): только так uvicorn сам поднимает выбранный loop
+    server.run()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
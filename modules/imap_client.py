@@ -1,11 +1,30 @@
 # modules/imap_client.py  (или твой путь)
 import asyncio
-import html
+import base64
+import binascii
+import codecs
 import imaplib
 import email
+import functools
+import os
+import quopri
+import re
+from concurrent.futures import ThreadPoolExecutor
 from email.header import decode_header, make_header
 from email.message import Message
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+# markupsafe (зависимость Jinja2) экранирует за один проход на C
+from markupsafe import escape as _escape_html
+
+try:
+    # Rust-парсер писем: на порядок быстрее stdlib email, сам декодирует charset и RFC2047
+    from fast_mail_parser import parse_email, ParseError
+except ImportError:  # pragma: no cover - без него работаем на stdlib
+    parse_email = None
+
+    class ParseError(Exception):
+        pass
 
 from .imap_config import IMAP_SERVERS, DEFAULT_PORT
 from .errors import UnknownMailDomainError, MailAuthError
@@ -13,6 +32,113 @@ from .logger import get_logger
 
 logger = get_logger(__name__)
 
+# Отдельный пул потоков под imaplib и разбор писем: предсказуемая ёмкость
+# и не конкурирует с дефолтным executor'ом (StaticFiles и т.п.)
+_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("IMAP_POOL", "16")), thread_name_prefix="imap")
+
+_UID_RE = re.compile(rb"\bUID (\d+)")
+
+# Для списка писем хватает заголовков — тело и вложения не качаем
+SUMMARY_FETCH_ITEMS = "(BODY.PEEK[HEADER.FIELDS (SUBJECT FROM TO DATE MESSAGE-ID)])"
+
+
+@functools.lru_cache(maxsize=4096)
+def _decode_header_cached(value: str) -> str:
+    """Кэш декодирования: одни и те же From/Subject (рассылки, частые отправители) повторяются."""
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return value
+
+
+def _decode_header_value(value: Optional[str]) -> str:
+    """Декодирует RFC2047-заголовки вроде =?utf-8?B?...?="""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return _decode_header_cached(value)
+    # email.header.Header (сырые 8-битные заголовки) нехэшируем — декодируем без кэша
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return str(value)
+
+
+@functools.lru_cache(maxsize=64)
+def _text_decoder(charset: str) -> Callable[..., Tuple[str, int]]:
+    """Декодер по имени кодировки; неизвестные и нетекстовые (base64, zlib, rot13…) читаем как utf-8."""
+    try:
+        info = codecs.lookup(charset)
+    except LookupError:
+        info = None
+    if info is None or not info._is_text_encoding:
+        info = codecs.lookup("utf-8")
+    return info.decode
+
+
+def _part_text(part: Message) -> str:
+    """
+    Тело части как текст. base64 и quoted-printable декодируем напрямую,
+    минуя диспетчеризацию get_payload(decode=True); остальное — через неё.
+    """
+    cte = (part.get("Content-Transfer-Encoding") or "").strip().lower()
+    try:
+        payload = part.get_payload()
+    except (UnicodeError, LookupError):
+        # 8-битное тело + экзотический charset: stdlib перекодирует его и падает — берём decode=True
+        payload = None
+    raw: Optional[bytes] = None
+
+    if isinstance(payload, str) and cte in ("base64", "quoted-printable"):
+        data = payload.encode("ascii", "surrogateescape")
+        try:
+            raw = base64.b64decode(data) if cte == "base64" else quopri.decodestring(data)
+        except (binascii.Error, ValueError):
+            raw = None  # битый base64 — пусть разбирается снисходительный stdlib
+    if raw is None:
+        raw = part.get_payload(decode=True) or b""
+
+    decode = _text_decoder(part.get_content_charset() or "utf-8")
+    try:
+        return decode(raw, "replace")[0]
+    except (UnicodeError, LookupError):
+        # часть текстовых кодеков (idna и т.п.) не поддерживает errors="replace"
+        return codecs.utf_8_decode(raw, "replace", True)[0]
+
+
+# Ссылки на фоновые задачи, чтобы их не собрал GC до завершения
+_background_tasks: Set["asyncio.Task[None]"] = set()
+
+
+def _spawn_background(coro) -> None:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+class LazyHeader:
+    """
+    Заголовок, который декодируется только при первом str().
+    Шаблон рендерит не все поля — незатронутые так и не декодируются.
+    """
+
+    __slots__ = ("_raw", "_decoded")
+
+    def __init__(self, value: Optional[str]):
+        self._raw = value
+        self._decoded: Optional[str] = None
+
+    def __str__(self) -> str:
+        if self._decoded is None:
+            self._decoded = _decode_header_value(self._raw) if self._raw else ""
+        return self._decoded
+
+    def __bool__(self) -> bool:
+        return bool(self._raw)
+
+    def __repr__(self) -> str:
+        return f"LazyHeader({self._raw!r})"
+
 
 class IMAPClient:
     """Асинхронный IMAP клиент: подключение, авторизация, получение писем."""
@@ -23,10 +149,15 @@ class IMAPClient:
         self.timeout = timeout
         self.server: Optional[imaplib.IMAP4_SSL] = None
         self._connected_host: Optional[str] = None  # удобно логировать, к какому хосту подключились
+        self._hosts: List[str] = self._resolve_hosts()
 
     # ---------- candidates & threading ----------
 
     def _candidate_hosts(self) -> List[str]:
+        """Кандидаты для подключения (вычисляются один раз при создании клиента)."""
+        return list(self._hosts)
+
+    def _resolve_hosts(self) -> List[str]:
         """
         Возвращает список кандидатов для подключения.
         Если домен известен — он один.
@@ -36,48 +167,88 @@ class IMAPClient:
         host = IMAP_SERVERS.get(domain)
         if host:
             return [host]
-        # фолбэк-кандидаты (порядок важен)
+        # фолбэк-кандидаты: пробуются одновременно, побеждает первый успешный вход
+        # (порядок решает только при одновременном успехе)
         return ["imap.firstmail.ltd", "imap.notletters.com"]
 
     async def _to_thread(self, func, *args, **kwargs):
         """Запуск блокирующих вызовов imaplib в отдельном потоке."""
-        return await asyncio.to_thread(func, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(_POOL, functools.partial(func, *args, **kwargs))
 
     # ---------- connect / disconnect ----------
 
+    async def _try_host(self, host: str) -> Tuple[imaplib.IMAP4_SSL, str]:
+        """Подключение + LOGIN к одному хосту. Возвращает живое соединение или бросает ошибку."""
+        # timeout поддерживается в Python 3.11: imaplib.IMAP4_SSL(..., timeout=...)
+        server = await self._to_thread(
+            imaplib.IMAP4_SSL, host, DEFAULT_PORT, None, None, None, self.timeout
+        )
+        try:
+            result, _ = await self._to_thread(server.login, self.email, self.password)
+        except BaseException:
+            await self._safe_logout(server)
+            raise
+        if result != "OK":
+            await self._safe_logout(server)
+            raise MailAuthError(f"Не удалось войти в почту на {host}")
+        return server, host
+
+    async def _safe_logout(self, server: imaplib.IMAP4_SSL) -> None:
+        try:
+            await self._to_thread(server.logout)
+        except Exception:
+            pass
+
+    async def _discard_attempt(self, task: "asyncio.Task[Tuple[imaplib.IMAP4_SSL, str]]") -> None:
+        """Дожидается проигравшей попытки и закрывает её соединение, если оно всё же открылось."""
+        try:
+            server, _ = await task
+        except Exception:
+            return
+        await self._safe_logout(server)
+
     async def connect(self):
-        """Пробует все кандидаты по очереди. Успешный — фиксируем и выходим."""
+        """
+        Пробует все кандидаты одновременно: задержка подключения — max по хостам, а не сумма.
+        Первый успешный вход фиксируем, остальные соединения закрываем в фоне.
+        """
+        hosts = self._candidate_hosts()
         last_error: Optional[Exception] = None
 
-        for host in self._candidate_hosts():
-            try:
-                # timeout поддерживается в Python 3.11: imaplib.IMAP4_SSL(..., timeout=...)
-                self.server = await self._to_thread(
-                    imaplib.IMAP4_SSL, host, DEFAULT_PORT, None, None, None, self.timeout
-                )
-                result, _ = await self._to_thread(self.server.login, self.email, self.password)
-                if result == "OK":
-                    self._connected_host = host
-                    logger.info("Успешный вход в %s (host=%s)", self.email, host)
+        attempts = {asyncio.create_task(self._try_host(host)): host for host in hosts}
+        pending = set(attempts)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # завершились одновременно — предпочитаем хост, стоящий раньше в списке
+                for task in sorted(done, key=lambda t: hosts.index(attempts[t])):
+                    try:
+                        server, host = task.result()
+                    except (MailAuthError, imaplib.IMAP4.error, OSError) as e:
+                        # любые ошибки сокета/SSL/IMAP — ждём остальные хосты
+                        logger.debug("Ошибка подключения к %s: %s", attempts[task], e)
+                        last_error = e
+                        continue
+
+                    if self.server is None:
+                        self.server = server
+                        self._connected_host = host
+                        logger.info("Успешный вход в %s (host=%s)", self.email, host)
+                    else:
+                        # одновременно вошли на двух хостах — лишнее соединение закрываем
+                        await self._safe_logout(server)
+
+                if self.server is not None:
                     return
-                # логин вернул не OK — закрываем соединение и пробуем следующий
-                try:
-                    await self._to_thread(self.server.logout)
-                except Exception:
-                    pass
-                self.server = None
-                last_error = MailAuthError(f"Не удалось войти в почту на {host}")
-            except (imaplib.IMAP4.error, OSError) as e:
-                # любые ошибки сокета/SSL/IMAP — пробуем следующий хост
-                logger.debug("Ошибка подключения к %s: %s", host, e)
-                last_error = e
-                self.server = None
-                continue
+        finally:
+            # поток imaplib не отменить — закрываем проигравшие соединения, когда они завершатся
+            for task in pending:
+                _spawn_background(self._discard_attempt(task))
 
         # если сюда дошли — ни один хост не подошёл
         raise MailAuthError(
             f"Не удалось подключиться ни к одному IMAP-хосту для {self.email}. "
-            f"Пробовали: {', '.join(self._candidate_hosts())}. "
+            f"Пробовали: {', '.join(hosts)}. "
             f"Последняя ошибка: {last_error}"
         )
 
@@ -93,6 +264,30 @@ class IMAPClient:
                 self.server = None
                 self._connected_host = None
 
+    async def abort(self) -> None:
+        """
+        Рвёт соединение без LOGOUT. Безопасно, даже если другой поток ещё внутри imaplib
+        (например, запрос отменили посреди FETCH): протокол не трогаем, только закрываем сокет.
+        """
+        server, self.server = self.server, None
+        self._connected_host = None
+        if server is not None:
+            try:
+                await self._to_thread(server.shutdown)
+            except Exception as e:
+                logger.debug("Ошибка при закрытии сокета: %s", e)
+
+    async def noop(self) -> bool:
+        """Проверка живости соединения (keepalive). False — соединение надо пересоздать."""
+        if not self.server:
+            return False
+        try:
+            typ, _ = await self._to_thread(self.server.noop)
+        except (imaplib.IMAP4.error, OSError) as e:
+            logger.debug("NOOP не прошёл (host=%s): %s", self._connected_host or "-", e)
+            return False
+        return typ == "OK"
+
     # ---------- API ----------
 
     async def get_messages(
@@ -102,73 +297,163 @@ class IMAPClient:
         criteria: str = "ALL",
         limit: int = 50,
         mark_seen: bool = False,
+        summary_only: bool = False,
     ) -> List[Dict[str, Any]]:
-        """Возвращает список писем в виде словарей (включая HTML)."""
+        """
+        Возвращает список писем в виде словарей (включая HTML).
+        summary_only=True — только заголовки: тело не качается и не разбирается.
+        """
         if not self.server:
             raise MailAuthError("Нет активного соединения IMAP.")
 
-        typ, _ = await self._to_thread(self.server.select, mailbox, readonly=True)
+        # горячие атрибуты — в локальные переменные
+        server = self.server
+        to_thread = self._to_thread
+
+        typ, _ = await to_thread(server.select, mailbox, readonly=True)
         if typ != "OK":
             raise MailAuthError(f"Не удалось выбрать ящик {mailbox}")
 
-        typ, data = await self._to_thread(self.server.search, None, criteria)
+        # UID, а не порядковые номера: они не сдвигаются после expunge и годятся для ссылок
+        typ, data = await to_thread(server.uid, "SEARCH", None, criteria)
         if typ != "OK":
             raise MailAuthError("Ошибка поиска писем.")
 
-        msg_ids = (data[0] or b"").split()
-        if not msg_ids:
+        msg_uids = (data[0] or b"").split()
+        if not msg_uids:
             return []
 
-        msg_ids = msg_ids[-limit:]  # последние N
-        fetch_items = "(RFC822)" if mark_seen else "(BODY.PEEK[])"
+        msg_uids = msg_uids[-limit:]  # последние N
+        if summary_only:
+            fetch_items = SUMMARY_FETCH_ITEMS
+        else:
+            fetch_items = "(RFC822)" if mark_seen else "(BODY.PEEK[])"
+
+        # Один FETCH на все id вместо round-trip на каждое письмо
+        typ, data = await to_thread(server.uid, "FETCH", b",".join(msg_uids), fetch_items)
+        if typ != "OK":
+            raise MailAuthError("Ошибка получения писем.")
 
-        messages: List[Dict[str, Any]] = []
+        # _parse_fetched уже отдаёт новые сверху
+        messages = await self._parse_fetched(data, summary_only=summary_only)
+        logger.info("Загружено писем: %s (host=%s)", len(messages), self._connected_host or "-")
+        return messages
+
+    async def get_message(
+        self,
+        uid: int,
+        *,
+        mailbox: str = "INBOX",
+        mark_seen: bool = False,
+    ) -> Optional[Dict[str, Any]]:
+        """Возвращает одно письмо целиком по UID или None, если его нет."""
+        if not self.server:
+            raise MailAuthError("Нет активного соединения IMAP.")
 
-        for msg_id in msg_ids:
-            typ, data = await self._to_thread(self.server.fetch, msg_id, fetch_items)
-            if typ != "OK" or not data or data[0] is None:
+        typ, _ = await self._to_thread(self.server.select, mailbox, readonly=not mark_seen)
+        if typ != "OK":
+            raise MailAuthError(f"Не удалось выбрать ящик {mailbox}")
+
+        fetch_items = "(RFC822)" if mark_seen else "(BODY.PEEK[])"
+        try:
+            typ, data = await self._to_thread(self.server.uid, "FETCH", str(uid), fetch_items)
+        except imaplib.IMAP4.abort:
+            # соединение оборвалось/рассинхронизировалось — пусть пул его выкинет
+            raise
+        except imaplib.IMAP4.error:
+            # несуществующий UID часть серверов отвергает как BAD
+            return None
+        if typ != "OK":
+            # …а часть — как NO: это не ошибка соединения, письма просто нет
+            return None
+
+        messages = await self._parse_fetched(data)
+        return messages[0] if messages else None
+
+    async def _parse_fetched(self, data: List[Any], *, summary_only: bool = False) -> List[Dict[str, Any]]:
+        """Разбор ответа UID FETCH. Порядок — новые сверху."""
+        to_thread = self._to_thread
+        parse = self._parse_message
+
+        # imaplib отдаёт [(b'1 (UID 7 BODY[] {N}', b'<raw>'), b')', (b'2 (...', b'<raw>'), b')', ...];
+        # UID сервер может прислать и после литерала: (b'1 (BODY[] {N}', b'<raw>'), b' UID 7)'.
+        # Ответ идёт по возрастанию номеров, независимо от порядка id в запросе — читаем с конца
+        data = data or []
+        items: List[Tuple[Optional[int], bytes]] = []
+        for i in range(len(data) - 1, -1, -1):
+            item = data[i]
+            if not isinstance(item, tuple):
                 continue
+            head, raw = item
+            found = _UID_RE.search(head)
+            if found is None and i + 1 < len(data) and isinstance(data[i + 1], bytes):
+                found = _UID_RE.search(data[i + 1])
+            items.append((int(found.group(1)) if found else None, raw))
+
+        # Разбор — CPU-работа: раскидываем по пулу потоков, не блокируя event loop
+        messages: List[Dict[str, Any]] = list(
+            await asyncio.gather(*(to_thread(parse, raw, summary_only) for _, raw in items))
+        )
+        for (uid, _), message in zip(items, messages):
+            message["uid"] = uid
+        return messages
 
-            raw_email = data[0][1]
-            msg: Message = email.message_from_bytes(raw_email)
+    # ---------- parsing ----------
 
-            subject = self._decode_maybe_encoded(msg.get("Subject"))
-            from_ = self._decode_maybe_encoded(msg.get("From"))
-            to = self._decode_maybe_encoded(msg.get("To"))
-            date = self._decode_maybe_encoded(msg.get("Date"))
-            msg_id_val = msg.get("Message-ID", "")
+    def _parse_message(self, raw_email: bytes, summary_only: bool = False) -> Dict[str, Any]:
+        """Разбирает письмо: сначала быстрым парсером, при ошибке — через stdlib email."""
+        if parse_email is not None:
+            try:
+                return self._parse_fast(raw_email, summary_only)
+            except ParseError as e:
+                logger.debug("fast_mail_parser не справился, фолбэк на stdlib: %s", e)
+        return self._parse_stdlib(raw_email, summary_only)
+
+    def _parse_fast(self, raw_email: bytes, summary_only: bool = False) -> Dict[str, Any]:
+        """Разбор через fast_mail_parser: заголовки уже декодированы на стороне Rust."""
+        parsed = parse_email(raw_email)
+        # имена заголовков приходят как написаны в письме (From/FROM/from) — нормализуем
+        headers = {k.lower(): v for k, v in parsed.headers.items()}
+
+        body_text = body_html = ""
+        if not summary_only:
+            body_text = "\n".join(parsed.text_plain).strip()
+            body_html = "\n".join(parsed.text_html).strip()
+            if not body_html and body_text:
+                body_html = self._plaintext_to_minimal_html(body_text)
 
+        return {
+            "subject": parsed.subject or "",
+            "from": headers.get("from", ""),
+            "to": headers.get("to", ""),
+            "date": headers.get("date", ""),
+            "message_id": headers.get("message-id", ""),
+            "body_text": body_text,
+            "body_html": body_html,
+        }
+
+    def _parse_stdlib(self, raw_email: bytes, summary_only: bool = False) -> Dict[str, Any]:
+        """Разбор через стандартный email-парсер (фолбэк). Заголовки декодируются лениво."""
+        msg: Message = email.message_from_bytes(raw_email)
+
+        body_text = body_html = ""
+        if not summary_only:
             body_text, body_html = self._extract_bodies(msg)
             if not body_html and body_text:
                 body_html = self._plaintext_to_minimal_html(body_text)
 
-            messages.append(
-                {
-                    "subject": subject,
-                    "from": from_,
-                    "to": to,
-                    "date": date,
-                    "message_id": msg_id_val,
-                    "body_text": body_text,
-                    "body_html": body_html,
-                }
-            )
-
-        messages.reverse()  # новые сверху
-        logger.info("Загружено писем: %s (host=%s)", len(messages), self._connected_host or "-")
-        return messages
+        return {
+            "subject": LazyHeader(msg.get("Subject")),
+            "from": LazyHeader(msg.get("From")),
+            "to": LazyHeader(msg.get("To")),
+            "date": LazyHeader(msg.get("Date")),
+            "message_id": msg.get("Message-ID", ""),
+            "body_text": body_text,
+            "body_html": body_html,
+        }
 
     # ---------- utils ----------
 
-    def _decode_maybe_encoded(self, value: Optional[str]) -> str:
-        """Декодирует RFC2047-заголовки вроде =?utf-8?B?...?="""
-        if value is None:
-            return ""
-        try:
-            return str(make_header(decode_header(value)))
-        except Exception:
-            return value
-
     def _extract_bodies(self, msg: Message) -> Tuple[str, str]:
         """Возвращает текстовую и HTML-версии тела письма."""
         plain_parts: List[str] = []
@@ -176,29 +461,25 @@ class IMAPClient:
 
         if msg.is_multipart():
             for part in msg.walk():
+                # обе версии уже есть — остальное дерево (вложения и т.п.) не трогаем
+                if plain_parts and html_parts:
+                    break
                 ctype = part.get_content_type()
                 disp = part.get("Content-Disposition", "")
-                if part.get_content_maintype() == "multipart":
+                # контейнеры и бинарные части (application/*, image/* …) не декодируем:
+                # base64 стоит O(размер вложения), а результат всё равно отбрасывается
+                if ctype not in ("text/plain", "text/html"):
                     continue
                 if disp and "attachment" in disp.lower():
                     continue
 
-                payload = part.get_payload(decode=True)
-                charset = part.get_content_charset() or "utf-8"
-
-                try:
-                    text = (payload or b"").decode(charset, errors="replace")
-                except Exception:
-                    text = (payload or b"").decode("utf-8", errors="replace")
-
+                text = _part_text(part)
                 if ctype == "text/plain":
                     plain_parts.append(text)
                 elif ctype == "text/html":
                     html_parts.append(text)
         else:
-            payload = msg.get_payload(decode=True)
-            charset = msg.get_content_charset() or "utf-8"
-            text = (payload or b"").decode(charset, errors="replace")
+            text = _part_text(msg)
             if msg.get_content_type() == "text/html":
                 html_parts.append(text)
             else:
@@ -208,4 +489,4 @@ class IMAPClient:
 
     def _plaintext_to_minimal_html(self, text: str) -> str:
         """Простой и безопасный фолбэк: экранируем и переведём \\n в <pre>."""
-        return "<pre style='white-space:pre-wrap;margin:0'>" + html.escape(text) + "</pre>"
+        return "<pre style='white-space:pre-wrap;margin:0'>" + str(_escape_html(text)) + "</pre>"
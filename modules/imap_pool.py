@@ -0,0 +1,163 @@
+# modules/imap_pool.py
+import asyncio
+import contextlib
+import hmac
+import time
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+from .imap_client import IMAPClient
+from .imap_config import IMAP_SERVERS
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+PoolKey = Tuple[str, str]
+
+
+class IMAPConnectionPool:
+    """
+    Пул живых IMAP-соединений, ключ — (host, email).
+    Экономит TLS-рукопожатие + LOGIN на каждый запрос /inbox.
+    """
+
+    def __init__(self, *, idle_timeout: float = 25 * 60, sweep_interval: float = 60):
+        # провайдеры рвут простаивающие соединения примерно через 30 минут
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self._clients: Dict[PoolKey, IMAPClient] = {}
+        self._last_used: Dict[PoolKey, float] = {}
+        self._locks: Dict[PoolKey, asyncio.Lock] = {}
+        # сколько корутин держат или ждут lock ключа — по нулю lock удаляется
+        self._lock_users: Dict[PoolKey, int] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+        self._background: Set[asyncio.Task] = set()
+
+    # ---------- keys & locks ----------
+
+    @staticmethod
+    def _key(email_addr: str) -> PoolKey:
+        domain = email_addr.split("@")[-1].strip().lower()
+        return IMAP_SERVERS.get(domain, domain), email_addr.strip().lower()
+
+    @contextlib.asynccontextmanager
+    async def _locked(self, key: PoolKey) -> AsyncIterator[None]:
+        """
+        Эксклюзивный доступ к ключу. Lock живёт, пока он кому-то нужен или в пуле есть
+        клиент: иначе каждый /login с новым адресом оставлял бы lock навсегда.
+        """
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._lock_users[key] = self._lock_users.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            users = self._lock_users[key] - 1
+            if users:
+                self._lock_users[key] = users
+            else:
+                del self._lock_users[key]
+                if key not in self._clients:
+                    self._locks.pop(key, None)
+
+    # ---------- API ----------
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, email_addr: str, password: str) -> AsyncIterator[IMAPClient]:
+        """
+        Выдаёт подключённый клиент. Соединение эксклюзивно на время блока
+        (imaplib не потокобезопасен). При любой ошибке или отмене запись выкидывается из пула:
+        поток imaplib может быть ещё внутри команды, и протокол уже рассинхронизирован.
+        """
+        self._ensure_sweeper()
+        key = self._key(email_addr)
+
+        async with self._locked(key):
+            try:
+                client = await self._checkout(key, email_addr, password)
+            except asyncio.CancelledError:
+                # отмена посреди NOOP: поток imaplib ещё может работать с соединением
+                self._discard(key)
+                raise
+            try:
+                yield client
+            except BaseException:
+                self._discard(key)
+                raise
+            else:
+                self._last_used[key] = time.monotonic()
+
+    async def evict(self, email_addr: str) -> None:
+        """Закрывает и убирает соединение пользователя (например, при logout)."""
+        key = self._key(email_addr)
+        async with self._locked(key):
+            await self._drop(key)
+
+    async def close(self) -> None:
+        """Закрывает все соединения и останавливает фоновую очистку."""
+        if self._sweeper:
+            self._sweeper.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._sweeper
+            self._sweeper = None
+        for key in list(self._clients):
+            async with self._locked(key):
+                await self._drop(key)
+
+    # ---------- internals ----------
+
+    async def _checkout(self, key: PoolKey, email_addr: str, password: str) -> IMAPClient:
+        client = self._clients.get(key)
+        if client is not None:
+            if not hmac.compare_digest(client.password.encode(), password.encode()):
+                # чужой/сменённый пароль не должен получать закэшированную сессию
+                fresh = IMAPClient(email_addr, password)
+                await fresh.connect()
+                await self._drop(key)
+                return self._store(key, fresh)
+            if await client.noop():
+                return client
+            logger.debug("Соединение %s протухло, переподключаемся", email_addr)
+            await self._drop(key)
+
+        client = IMAPClient(email_addr, password)
+        await client.connect()
+        return self._store(key, client)
+
+    def _store(self, key: PoolKey, client: IMAPClient) -> IMAPClient:
+        self._clients[key] = client
+        self._last_used[key] = time.monotonic()
+        return client
+
+    async def _drop(self, key: PoolKey) -> None:
+        client = self._clients.pop(key, None)
+        self._last_used.pop(key, None)
+        if client is not None:
+            await client.disconnect()
+
+    def _discard(self, key: PoolKey) -> None:
+        """Убирает клиента без LOGOUT; сокет закрывается в фоне."""
+        client = self._clients.pop(key, None)
+        self._last_used.pop(key, None)
+        if client is not None:
+            task = asyncio.create_task(client.abort())
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    def _ensure_sweeper(self) -> None:
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep_idle())
+
+    async def _sweep_idle(self) -> None:
+        """Фоновая задача: разлогинивает соединения, простаивающие дольше idle_timeout."""
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            deadline = time.monotonic() - self.idle_timeout
+            for key in [k for k, ts in self._last_used.items() if ts < deadline]:
+                if self._lock_users.get(key):
+                    continue  # соединение сейчас используется
+                async with self._locked(key):
+                    if self._last_used.get(key, 0) < deadline:
+                        logger.info("Закрываем простаивающее соединение (host=%s, email=%s)", *key)
+                        await self._drop(key)
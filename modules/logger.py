@@ -1,7 +1,8 @@
 # app/logging.py
+import os
+import sys
 import logging
 from typing import Optional
-from rich.logging import RichHandler
 
 class LoggerManager:
     def __init__(
@@ -11,12 +12,15 @@ class LoggerManager:
         fmt: str = "[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s",
         datefmt: str = "%H:%M:%S",
         log_file: Optional[str] = None,
+        pretty: Optional[bool] = None,
     ):
         self.root_name = root_name
         self.level = level
         self.fmt = fmt
         self.datefmt = datefmt
         self.log_file = log_file
+        # Rich — только по запросу (LOG_PRETTY=1): рендер Console на каждую запись дорогой
+        self.pretty = bool(os.getenv("LOG_PRETTY")) if pretty is None else pretty
         self._configured = False
 
     def configure(self):
@@ -30,7 +34,12 @@ class LoggerManager:
         # Чистим хендлеры, если перезапускаем в тестах/uvicorn и т.п.
         root.handlers.clear()
 
-        console = RichHandler(rich_tracebacks=True)
+        if self.pretty:
+            from rich.logging import RichHandler
+
+            console = RichHandler(rich_tracebacks=True)
+        else:
+            console = logging.StreamHandler(sys.stderr)
         console.setLevel(self.level)
         console.setFormatter(formatter)
         root.addHandler(console)
@@ -55,9 +64,13 @@ class LoggerManager:
 # Глобальный экземпляр
 _logger_manager = LoggerManager()
 
-def init_logging(*, level: int = logging.DEBUG, log_file: Optional[str] = None):
+def init_logging(*, level: int = logging.DEBUG, log_file: Optional[str] = None, pretty: Optional[bool] = None):
     _logger_manager.level = level
     _logger_manager.log_file = log_file
+    if pretty is not None:
+        _logger_manager.pretty = pretty
+    # Модули могли уже получить логгер при импорте — перенастраиваем с новыми параметрами
+    _logger_manager._configured = False
     _logger_manager.configure()
 
 def get_logger(module_name: str) -> logging.Logger: